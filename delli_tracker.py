@@ -5,19 +5,58 @@ Fetches products from Delli's Shopify API and tracks changes over time.
 Uses SQLite for efficient storage and querying.
 """
 
+import hashlib
 import sqlite3
+import sys
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
-import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
+from typing import Iterator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
 
 
 BASE_URL = "https://delli.market"
+PRODUCT_URL_PREFIX = f"{BASE_URL}/products/"
 DATA_DIR = Path(__file__).parent / "data"
 DB_FILE = DATA_DIR / "delli.db"
+PAGE_SIZE = 250
+FETCH_WORKERS = 4
+MIN_REQUEST_INTERVAL = 0.1  # seconds per page, averaged over a batch
+
+# Shared session so pagination reuses one keep-alive connection
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=FETCH_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504)),
+))
+
+
+def json_dumps(obj) -> str:
+    """Serialize to a JSON string, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    # Match orjson's compact, unescaped output so stored text doesn't
+    # depend on which encoder is installed
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def json_loads(data: bytes):
+    """Parse JSON from raw bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 @dataclass
@@ -36,6 +75,16 @@ def get_db() -> sqlite3.Connection:
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
 
+    # Batch workload: WAL with NORMAL sync avoids a double fsync per commit.
+    # The WAL is checkpointed back into delli.db when the connection closes.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.execute("PRAGMA mmap_size=268435456")
+
+    migrate_prices_to_pence(conn)
+
     conn.executescript("""
         CREATE TABLE IF NOT EXISTS products (
             id INTEGER PRIMARY KEY,
@@ -43,8 +92,8 @@ def get_db() -> sqlite3.Connection:
             title TEXT,
             vendor TEXT,
             product_type TEXT,
-            price TEXT,
-            compare_at_price TEXT,
+            price INTEGER,
+            compare_at_price INTEGER,
             on_sale INTEGER,
             available INTEGER,
             tags TEXT,
@@ -52,14 +101,15 @@ def get_db() -> sqlite3.Connection:
             variant_count INTEGER,
             first_seen TEXT,
             last_seen TEXT,
-            removed INTEGER DEFAULT 0
+            removed INTEGER DEFAULT 0,
+            content_hash INTEGER
         );
 
         CREATE TABLE IF NOT EXISTS price_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             product_id INTEGER,
-            price TEXT,
-            compare_at_price TEXT,
+            price INTEGER,
+            compare_at_price INTEGER,
             recorded_at TEXT,
             FOREIGN KEY (product_id) REFERENCES products(id)
         );
@@ -88,45 +138,178 @@ def get_db() -> sqlite3.Connection:
         CREATE INDEX IF NOT EXISTS idx_changes_product ON changes(product_id);
         CREATE INDEX IF NOT EXISTS idx_changes_type ON changes(change_type);
         CREATE INDEX IF NOT EXISTS idx_products_vendor ON products(vendor);
+        CREATE INDEX IF NOT EXISTS idx_products_active ON products(id) WHERE removed = 0;
     """)
 
+    # Databases created before content hashing lack the column
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(products)")}
+    if "content_hash" not in columns:
+        conn.execute("ALTER TABLE products ADD COLUMN content_hash INTEGER")
+
     return conn
 
 
+def migrate_prices_to_pence(conn: sqlite3.Connection):
+    """Convert legacy TEXT price columns (e.g. "12.50") to INTEGER pence.
+
+    SQLite can't change a column's type in place, so the products and
+    price_history tables are rebuilt. Indexes dropped with the old tables
+    are recreated by get_db(). Prices inside changes.details are converted
+    in the same transaction.
+    """
+    columns = {row["name"]: row["type"] for row in conn.execute("PRAGMA table_info(products)")}
+    if columns.get("price") != "TEXT":
+        return
+
+    print("Migrating prices to integer pence...")
+    conn.executescript("""
+        BEGIN;
+
+        CREATE TABLE products_new (
+            id INTEGER PRIMARY KEY,
+            handle TEXT,
+            title TEXT,
+            vendor TEXT,
+            product_type TEXT,
+            price INTEGER,
+            compare_at_price INTEGER,
+            on_sale INTEGER,
+            available INTEGER,
+            tags TEXT,
+            image_url TEXT,
+            variant_count INTEGER,
+            first_seen TEXT,
+            last_seen TEXT,
+            removed INTEGER DEFAULT 0
+        );
+        INSERT INTO products_new
+        SELECT id, handle, title, vendor, product_type,
+            CAST(ROUND(CAST(NULLIF(price, '') AS REAL) * 100) AS INTEGER),
+            CAST(ROUND(CAST(NULLIF(compare_at_price, '') AS REAL) * 100) AS INTEGER),
+            on_sale, available, tags, image_url, variant_count, first_seen, last_seen, removed
+        FROM products;
+        DROP TABLE products;
+        ALTER TABLE products_new RENAME TO products;
+
+        CREATE TABLE price_history_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            price INTEGER,
+            compare_at_price INTEGER,
+            recorded_at TEXT,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        );
+        INSERT INTO price_history_new
+        SELECT id, product_id,
+            CAST(ROUND(CAST(NULLIF(price, '') AS REAL) * 100) AS INTEGER),
+            CAST(ROUND(CAST(NULLIF(compare_at_price, '') AS REAL) * 100) AS INTEGER),
+            recorded_at
+        FROM price_history;
+        DROP TABLE price_history;
+        ALTER TABLE price_history_new RENAME TO price_history;
+
+        -- Prices recorded in change details were pound strings too
+        UPDATE changes SET details = json_set(details, '$.price',
+            CAST(ROUND(CAST(NULLIF(json_extract(details, '$.price'), '') AS REAL) * 100) AS INTEGER))
+        WHERE json_type(details, '$.price') = 'text';
+        UPDATE changes SET details = json_set(details, '$.old_price',
+            CAST(ROUND(CAST(NULLIF(json_extract(details, '$.old_price'), '') AS REAL) * 100) AS INTEGER))
+        WHERE json_type(details, '$.old_price') = 'text';
+        UPDATE changes SET details = json_set(details, '$.new_price',
+            CAST(ROUND(CAST(NULLIF(json_extract(details, '$.new_price'), '') AS REAL) * 100) AS INTEGER))
+        WHERE json_type(details, '$.new_price') = 'text';
+        UPDATE changes SET details = json_set(details, '$.compare_at_price',
+            CAST(ROUND(CAST(NULLIF(json_extract(details, '$.compare_at_price'), '') AS REAL) * 100) AS INTEGER))
+        WHERE json_type(details, '$.compare_at_price') = 'text';
+
+        COMMIT;
+    """)
+
+
+def fetch_page(page: int) -> list[dict]:
+    """Fetch a single page of products."""
+    url = f"{BASE_URL}/products.json?limit={PAGE_SIZE}&page={page}"
+    response = SESSION.get(url, timeout=30)
+    response.raise_for_status()
+    return json_loads(response.content).get("products", [])
+
+
 def fetch_all_products() -> list[dict]:
-    """Fetch all products from Delli's API with pagination."""
+    """Fetch all products from Delli's API, requesting pages in parallel batches."""
     all_products = []
     page = 1
 
     print("Fetching products from Delli...")
 
-    while True:
-        url = f"{BASE_URL}/products.json?limit=250&page={page}"
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        done = False
+        while not done:
+            started = time.monotonic()
+            batch = range(page, page + FETCH_WORKERS)
+            futures = [executor.submit(fetch_page, p) for p in batch]
+
+            # Merge in page order, stopping at the first empty/short page or error
+            for p, future in zip(batch, futures):
+                try:
+                    products = future.result()
+                except (requests.RequestException, ValueError) as e:
+                    print(f"  Error fetching page {p}: {e}")
+                    done = True
+                    break
+
+                if not products:
+                    done = True
+                    break
+
+                all_products.extend(products)
+                print(f"  Page {p}: {len(products)} products (total: {len(all_products)})")
+
+                if len(products) < PAGE_SIZE:
+                    done = True
+                    break
+
+            page += FETCH_WORKERS
+
+            # Only pause if the batch came back faster than the polite minimum
+            elapsed = time.monotonic() - started
+            min_interval = MIN_REQUEST_INTERVAL * FETCH_WORKERS
+            if not done and elapsed < min_interval:
+                time.sleep(min_interval - elapsed)
 
-        try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            products = data.get("products", [])
+    print(f"Total: {len(all_products)} products")
+    return all_products
 
-            if not products:
-                break
 
-            all_products.extend(products)
-            print(f"  Page {page}: {len(products)} products (total: {len(all_products)})")
-            page += 1
-            time.sleep(0.5)
+def to_pence(value) -> int | None:
+    """Convert a Shopify price string (e.g. "12.50") to integer pence."""
+    if not value:
+        return None
+    try:
+        return int(round(float(value) * 100))
+    except (ValueError, TypeError):
+        return None
 
-        except requests.RequestException as e:
-            print(f"  Error fetching page {page}: {e}")
-            break
 
-    print(f"Total: {len(all_products)} products")
-    return all_products
+def format_price(pence: int | None) -> str:
+    """Format integer pence as pounds for display (e.g. 1250 -> "12.50")."""
+    if pence is None:
+        return "?"
+    return f"{pence / 100:.2f}"
 
 
-def extract_product_data(product: dict) -> dict:
-    """Extract key fields from a product."""
+def content_hash(fields: tuple) -> int:
+    """Fast 64-bit digest of a product's fields, signed to fit an SQLite INTEGER."""
+    digest = hashlib.blake2b(repr(fields).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def extract_product_row(product: dict, timestamp: str) -> tuple:
+    """Extract key fields from a product as a row for the products UPSERT.
+
+    Columns are ordered as: id, handle, title, vendor, product_type, price,
+    compare_at_price, on_sale, available, tags, image_url, variant_count,
+    content_hash, first_seen, last_seen.
+    """
     variants = product.get("variants", [])
 
     price = None
@@ -135,31 +318,69 @@ def extract_product_data(product: dict) -> dict:
 
     if variants:
         first_variant = variants[0]
-        price = first_variant.get("price")
-        compare_at_price = first_variant.get("compare_at_price")
+        raw_price = first_variant.get("price")
+        raw_compare_at_price = first_variant.get("compare_at_price")
+        price = to_pence(raw_price)
+        # Identical strings (common when not on sale) don't need a second parse
+        if raw_compare_at_price == raw_price:
+            compare_at_price = price
+        else:
+            compare_at_price = to_pence(raw_compare_at_price)
         available = any(v.get("available", False) for v in variants)
 
-    on_sale = False
-    if price and compare_at_price:
-        try:
-            on_sale = float(compare_at_price) > float(price)
-        except (ValueError, TypeError):
-            pass
-
-    return {
-        "id": product.get("id"),
-        "handle": product.get("handle"),
-        "title": product.get("title"),
-        "vendor": product.get("vendor"),
-        "product_type": product.get("product_type"),
-        "price": price,
-        "compare_at_price": compare_at_price,
-        "on_sale": on_sale,
-        "available": available,
-        "tags": json.dumps(product.get("tags", [])),
-        "image_url": product.get("images", [{}])[0].get("src") if product.get("images") else None,
-        "variant_count": len(variants),
-    }
+    on_sale = price is not None and compare_at_price is not None and compare_at_price > price
+
+    # A few hundred vendors/types are shared by thousands of products
+    vendor = product.get("vendor")
+    if vendor:
+        vendor = sys.intern(vendor)
+    product_type = product.get("product_type")
+    if product_type:
+        product_type = sys.intern(product_type)
+
+    images = product.get("images")
+    image_url = images[0].get("src") if images else None
+
+    fields = (
+        product.get("id"),
+        product.get("handle"),
+        product.get("title"),
+        vendor,
+        product_type,
+        price,
+        compare_at_price,
+        on_sale,
+        available,
+        json_dumps(product.get("tags", [])),
+        image_url,
+        len(variants),
+    )
+    return fields + (content_hash(fields), timestamp, timestamp)
+
+
+# Column order matches the tuples built by extract_product_row()
+UPSERT_PRODUCT_SQL = """
+    INSERT INTO products (id, handle, title, vendor, product_type, price,
+        compare_at_price, on_sale, available, tags, image_url, variant_count,
+        content_hash, first_seen, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET handle=excluded.handle, title=excluded.title,
+        vendor=excluded.vendor, product_type=excluded.product_type, price=excluded.price,
+        compare_at_price=excluded.compare_at_price, on_sale=excluded.on_sale,
+        available=excluded.available, tags=excluded.tags, image_url=excluded.image_url,
+        variant_count=excluded.variant_count, content_hash=excluded.content_hash,
+        last_seen=excluded.last_seen, removed=0
+"""
+
+INSERT_PRICE_HISTORY_SQL = """
+    INSERT INTO price_history (product_id, price, compare_at_price, recorded_at)
+    VALUES (?, ?, ?, ?)
+"""
+
+INSERT_CHANGE_SQL = """
+    INSERT INTO changes (product_id, handle, title, vendor, change_type, details, recorded_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
 
 
 def sync_products(conn: sqlite3.Connection, products: list[dict], timestamp: str) -> list[ProductChange]:
@@ -167,111 +388,146 @@ def sync_products(conn: sqlite3.Connection, products: list[dict], timestamp: str
     changes = []
     cursor = conn.cursor()
 
-    # Get existing products
-    cursor.execute("SELECT * FROM products WHERE removed = 0")
+    # Get existing products (only the columns compared below)
+    cursor.execute("""
+        SELECT id, handle, title, vendor, price, on_sale, available, content_hash
+        FROM products WHERE removed = 0
+    """)
     existing = {row["id"]: dict(row) for row in cursor.fetchall()}
     existing_ids = set(existing.keys())
 
-    # Process fetched products
+    # Process fetched products, collecting rows for batched writes
     fetched_ids = set()
+    upsert_rows = []
+    price_rows = []
 
     for raw_product in products:
-        p = extract_product_data(raw_product)
-        pid = p["id"]
+        row = extract_product_row(raw_product, timestamp)
+        # Unpack the full row so a column change can't shift these silently
+        (pid, handle, title, vendor, _, price, compare_at_price, on_sale, available,
+         _, _, _, row_hash, _, _) = row
         fetched_ids.add(pid)
 
         if pid not in existing_ids:
-            # New product
-            cursor.execute("""
-                INSERT INTO products (id, handle, title, vendor, product_type, price,
-                    compare_at_price, on_sale, available, tags, image_url, variant_count,
-                    first_seen, last_seen)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (pid, p["handle"], p["title"], p["vendor"], p["product_type"], p["price"],
-                  p["compare_at_price"], p["on_sale"], p["available"], p["tags"],
-                  p["image_url"], p["variant_count"], timestamp, timestamp))
-
-            # Record initial price
-            cursor.execute("""
-                INSERT INTO price_history (product_id, price, compare_at_price, recorded_at)
-                VALUES (?, ?, ?, ?)
-            """, (pid, p["price"], p["compare_at_price"], timestamp))
+            upsert_rows.append(row)
+
+            # New product - record initial price
+            price_rows.append((pid, price, compare_at_price, timestamp))
 
             changes.append(ProductChange(
-                product_id=pid, handle=p["handle"], title=p["title"], vendor=p["vendor"],
-                change_type="new", details={"price": p["price"]}
+                product_id=pid, handle=handle, title=title, vendor=vendor,
+                change_type="new", details={"price": price}
             ))
         else:
-            # Existing product - check for changes
+            # Existing product - an unchanged hash means no field comparisons
+            # and no rewrite are needed
             old = existing[pid]
+            if old["content_hash"] == row_hash:
+                continue
+
+            upsert_rows.append(row)
 
             # Price change
-            if old["price"] != p["price"]:
-                cursor.execute("""
-                    INSERT INTO price_history (product_id, price, compare_at_price, recorded_at)
-                    VALUES (?, ?, ?, ?)
-                """, (pid, p["price"], p["compare_at_price"], timestamp))
+            if old["price"] != price:
+                price_rows.append((pid, price, compare_at_price, timestamp))
 
                 changes.append(ProductChange(
-                    product_id=pid, handle=p["handle"], title=p["title"], vendor=p["vendor"],
+                    product_id=pid, handle=handle, title=title, vendor=vendor,
                     change_type="price_change",
-                    details={"old_price": old["price"], "new_price": p["price"]}
+                    details={"old_price": old["price"], "new_price": price}
                 ))
 
             # Availability change
-            if old["available"] != p["available"]:
+            if old["available"] != available:
                 changes.append(ProductChange(
-                    product_id=pid, handle=p["handle"], title=p["title"], vendor=p["vendor"],
+                    product_id=pid, handle=handle, title=title, vendor=vendor,
                     change_type="availability_change",
-                    details={"was_available": bool(old["available"]), "now_available": p["available"]}
+                    details={"was_available": bool(old["available"]), "now_available": available}
                 ))
 
             # Sale started
-            if not old["on_sale"] and p["on_sale"]:
+            if not old["on_sale"] and on_sale:
                 changes.append(ProductChange(
-                    product_id=pid, handle=p["handle"], title=p["title"], vendor=p["vendor"],
+                    product_id=pid, handle=handle, title=title, vendor=vendor,
                     change_type="sale_started",
-                    details={"price": p["price"], "compare_at_price": p["compare_at_price"]}
+                    details={"price": price, "compare_at_price": compare_at_price}
                 ))
 
             # Sale ended
-            if old["on_sale"] and not p["on_sale"]:
+            if old["on_sale"] and not on_sale:
                 changes.append(ProductChange(
-                    product_id=pid, handle=p["handle"], title=p["title"], vendor=p["vendor"],
-                    change_type="sale_ended", details={"price": p["price"]}
+                    product_id=pid, handle=handle, title=title, vendor=vendor,
+                    change_type="sale_ended", details={"price": price}
                 ))
 
-            # Update product
-            cursor.execute("""
-                UPDATE products SET handle=?, title=?, vendor=?, product_type=?, price=?,
-                    compare_at_price=?, on_sale=?, available=?, tags=?, image_url=?,
-                    variant_count=?, last_seen=?
-                WHERE id=?
-            """, (p["handle"], p["title"], p["vendor"], p["product_type"], p["price"],
-                  p["compare_at_price"], p["on_sale"], p["available"], p["tags"],
-                  p["image_url"], p["variant_count"], timestamp, pid))
-
     # Mark removed products
     removed_ids = existing_ids - fetched_ids
     for pid in removed_ids:
         old = existing[pid]
-        cursor.execute("UPDATE products SET removed = 1 WHERE id = ?", (pid,))
         changes.append(ProductChange(
             product_id=pid, handle=old["handle"], title=old["title"], vendor=old["vendor"],
             change_type="removed", details={}
         ))
 
-    # Record changes
-    for c in changes:
-        cursor.execute("""
-            INSERT INTO changes (product_id, handle, title, vendor, change_type, details, recorded_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (c.product_id, c.handle, c.title, c.vendor, c.change_type, json.dumps(c.details), timestamp))
+    change_rows = [
+        (c.product_id, c.handle, c.title, c.vendor, c.change_type, json_dumps(c.details), timestamp)
+        for c in changes
+    ]
+
+    with conn:
+        # Insert new products and update changed ones in one pass. A product
+        # that was previously removed and has reappeared is revived in place.
+        cursor.executemany(UPSERT_PRODUCT_SQL, upsert_rows)
+        cursor.executemany(INSERT_PRICE_HISTORY_SQL, price_rows)
+
+        cursor.executemany("UPDATE products SET removed = 1 WHERE id = ?",
+                           [(pid,) for pid in removed_ids])
+
+        # Every product still active was seen in this fetch
+        cursor.execute("UPDATE products SET last_seen = ? WHERE removed = 0", (timestamp,))
+
+        # Record changes
+        cursor.executemany(INSERT_CHANGE_SQL, change_rows)
 
-    conn.commit()
     return changes
 
 
+# Per-type line formatters, looked up once per change type in the reports
+CHANGE_FORMATTERS = {
+    "new": lambda c: f"  + {c.title} ({c.vendor}) - £{format_price(c.details['price'])}",
+    "removed": lambda c: f"  - {c.title} ({c.vendor})",
+    "price_change": lambda c: (
+        f"  {c.title}: £{format_price(c.details['old_price'])} -> £{format_price(c.details['new_price'])}"
+    ),
+    "availability_change": lambda c: (
+        f"  {c.title}: {'Back in stock' if c.details['now_available'] else 'Sold out'}"
+    ),
+    "sale_started": lambda c: (
+        f"  {c.title}: ON SALE £{format_price(c.details['price'])}"
+        f" (was £{format_price(c.details['compare_at_price'])})"
+    ),
+    "sale_ended": lambda c: f"  {c.title}: Sale ended - now £{format_price(c.details['price'])}",
+}
+
+MARKDOWN_FORMATTERS = {
+    "price_change": lambda c, url: (
+        f"- [{c.title}]({url}): £{format_price(c.details['old_price'])} → £{format_price(c.details['new_price'])}"
+    ),
+    "availability_change": lambda c, url: (
+        f"- [{c.title}]({url}): {'✅ Back in stock' if c.details['now_available'] else '❌ Sold out'}"
+    ),
+    "sale_started": lambda c, url: (
+        f"- [{c.title}]({url}): **£{format_price(c.details['price'])}**"
+        f" ~~£{format_price(c.details['compare_at_price'])}~~"
+    ),
+}
+
+
+def format_markdown_default(c: ProductChange, url: str) -> str:
+    """Markdown line for change types without a dedicated formatter."""
+    return f"- [{c.title}]({url}) ({c.vendor})"
+
+
 def print_changes_summary(changes: list[ProductChange]):
     """Print a summary of detected changes."""
     if not changes:
@@ -303,35 +559,25 @@ def print_changes_summary(changes: list[ProductChange]):
         print(f"\n{label} ({len(items)}):")
         print("-" * 40)
 
+        fmt = CHANGE_FORMATTERS[change_type]
         for c in items[:10]:
-            if change_type == "new":
-                print(f"  + {c.title} ({c.vendor}) - £{c.details['price']}")
-            elif change_type == "removed":
-                print(f"  - {c.title} ({c.vendor})")
-            elif change_type == "price_change":
-                print(f"  {c.title}: £{c.details['old_price']} -> £{c.details['new_price']}")
-            elif change_type == "availability_change":
-                status = "Back in stock" if c.details['now_available'] else "Sold out"
-                print(f"  {c.title}: {status}")
-            elif change_type == "sale_started":
-                print(f"  {c.title}: ON SALE £{c.details['price']} (was £{c.details['compare_at_price']})")
-            elif change_type == "sale_ended":
-                print(f"  {c.title}: Sale ended - now £{c.details['price']}")
+            print(fmt(c))
 
         if len(items) > 10:
             print(f"  ... and {len(items) - 10} more")
 
 
-def generate_github_summary(changes: list[ProductChange]) -> str:
-    """Generate markdown summary for GitHub Actions."""
-    lines = ["# Delli Product Tracker Report", ""]
+def generate_github_summary(changes: list[ProductChange]) -> Iterator[str]:
+    """Yield newline-terminated markdown summary lines for GitHub Actions."""
+    yield "# Delli Product Tracker Report\n"
+    yield "\n"
 
     if not changes:
-        lines.append("No changes detected.")
-        return "\n".join(lines)
+        yield "No changes detected.\n"
+        return
 
-    lines.append(f"**{len(changes)} changes detected**")
-    lines.append("")
+    yield f"**{len(changes)} changes detected**\n"
+    yield "\n"
 
     by_type: dict[str, list[ProductChange]] = {}
     for c in changes:
@@ -344,26 +590,16 @@ def generate_github_summary(changes: list[ProductChange]) -> str:
 
     for change_type, items in by_type.items():
         emoji = type_emoji.get(change_type, "•")
-        lines.append(f"## {emoji} {change_type.replace('_', ' ').title()} ({len(items)})")
-        lines.append("")
+        yield f"## {emoji} {change_type.replace('_', ' ').title()} ({len(items)})\n"
+        yield "\n"
 
+        fmt = MARKDOWN_FORMATTERS.get(change_type, format_markdown_default)
         for c in items[:20]:
-            url = f"https://delli.market/products/{c.handle}"
-            if change_type == "price_change":
-                lines.append(f"- [{c.title}]({url}): £{c.details['old_price']} → £{c.details['new_price']}")
-            elif change_type == "availability_change":
-                status = "✅ Back in stock" if c.details['now_available'] else "❌ Sold out"
-                lines.append(f"- [{c.title}]({url}): {status}")
-            elif change_type == "sale_started":
-                lines.append(f"- [{c.title}]({url}): **£{c.details['price']}** ~~£{c.details['compare_at_price']}~~")
-            else:
-                lines.append(f"- [{c.title}]({url}) ({c.vendor})")
+            yield fmt(c, PRODUCT_URL_PREFIX + c.handle) + "\n"
 
         if len(items) > 20:
-            lines.append(f"- *... and {len(items) - 20} more*")
-        lines.append("")
-
-    return "\n".join(lines)
+            yield f"- *... and {len(items) - 20} more*\n"
+        yield "\n"
 
 
 def main():
@@ -387,9 +623,11 @@ def main():
 
     # Fetch and sync
     raw_products = fetch_all_products()
+    SESSION.close()
 
     if not raw_products:
         print("ERROR: No products fetched. Exiting.")
+        conn.close()
         return
 
     changes = sync_products(conn, raw_products, timestamp)
@@ -407,9 +645,8 @@ def main():
 
     # GitHub Actions summary
     if os.getenv("GITHUB_STEP_SUMMARY"):
-        summary = generate_github_summary(changes)
-        with open(os.environ["GITHUB_STEP_SUMMARY"], "a") as f:
-            f.write(summary)
+        with open(os.environ["GITHUB_STEP_SUMMARY"], "a", encoding="utf-8") as f:
+            f.writelines(generate_github_summary(changes))
 
     # Final stats
     cursor.execute("SELECT COUNT(*) FROM products WHERE removed = 0")